@@ -3,10 +3,20 @@ import re
 import logging
 import time
 import random
-from playwright.sync_api import sync_playwright, TimeoutError as PlaywrightTimeoutError
-from playwright_stealth.sync import stealth_sync # <-- Correct import
+import asyncio
+import glob
+import shutil
+from functools import lru_cache
+from typing import NamedTuple
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from playwright.async_api import async_playwright, expect, TimeoutError as PlaywrightTimeoutError
+from playwright_stealth import stealth_async
 from supabase import create_client, Client
+import orjson
 import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from lxml import etree, html as lxml_html
 
 # --- Logger Setup ---
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -14,6 +24,27 @@ logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(
 # --- CONFIGURATION ---
 ATTENDANCE_URL = "http://103.159.68.60:3535/attendance"
 HEADLESS_MODE = True 
+SIMULATE_HUMAN = os.environ.get("SIMULATE_HUMAN") == "1"
+STORAGE_STATE_PATH = os.environ.get("STORAGE_STATE_PATH", "state.json")
+SCRAPE_OUTPUT_DIR = os.environ.get("SCRAPE_OUTPUT_DIR", "scrape_output")
+SCRAPE_STAGING_DIR = f"{SCRAPE_OUTPUT_DIR}.partial"
+UPLOAD_ONLY = os.environ.get("UPLOAD_ONLY") == "1"
+SECTIONS = ["Section Section A", "Section Section B", "Section Section C"]
+SECTION_DROPDOWN_SELECTOR = 'label:has-text("Select Section") + button'
+ATTENDANCE_TYPE_DROPDOWN_SELECTOR = 'label:has-text("Select Attendance Type") + button'
+COURSE_DROPDOWN_SELECTOR = 'label:has-text("Select Course") + button'
+LISTBOX_OPTION_SELECTOR = 'div[role="listbox"] [role="option"]'
+DROPDOWN_TIMEOUT = 15000
+MAX_PARALLEL_COURSES = 4
+MAX_PAGES_PER_COURSE = 500
+FETCH_PAGE_SIZE = 1000
+UPSERT_CHUNK_SIZE = 500
+UPSERT_WORKERS = 4
+SUPABASE_MAX_RETRIES = 3
+UPLOAD_WORKERS = 4
+STATUS_CATEGORIES = ['P', 'A', 'NA', 'Unknown']
+STATUS_CODES = 'PANU'  # one character per STATUS_CATEGORIES entry
+MISSING_STATUS_CODE = '-'
 
 # --- Supabase Credentials (from GitHub Secrets) ---
 SUPABASE_URL = os.environ.get("SUPABASE_URL")
@@ -21,277 +52,597 @@ SUPABASE_KEY = os.environ.get("SUPABASE_KEY")
 logging.info("--- Configuration ---")
 logging.info(f"URL: {ATTENDANCE_URL}")
 logging.info(f"Headless Mode: {HEADLESS_MODE}")
+logging.info(f"Simulate Human Pauses: {SIMULATE_HUMAN}")
+logging.info(f"Upload Only: {UPLOAD_ONLY}")
 logging.info(f"Supabase URL Loaded: {'Yes' if SUPABASE_URL else 'No'}")
 logging.info(f"Supabase Key Loaded: {'Yes' if SUPABASE_KEY else 'No'}\n")
 
 
 # --- Helper Functions ---
+INVALID_TABLE_CHARS_RE = re.compile(r'[^a-zA-Z0-9_]')
+REPEATED_UNDERSCORES_RE = re.compile(r'__+')
+DATE_HEADER_RE = re.compile(r'^\d{2}/\d{2}/\d{4}$')
+
+class StudentRow(NamedTuple):
+    """One scraped table row; status_codes packs one STATUS_CODES character per page date."""
+    roll_no: str
+    name: str
+    status_codes: str
+
+class AttendancePage(NamedTuple):
+    """One scraped page set of a course: its date headers and student rows."""
+    dates: list
+    rows: list
+    section: str = 'Unknown'
+
+@lru_cache(maxsize=1024)
 def sanitize_table_name(name):
     """Sanitizes a string to be a valid table name."""
-    name = re.sub(r'[^a-zA-Z0-9_]', '_', name)
-    name = re.sub(r'__+', '_', name)
+    name = INVALID_TABLE_CHARS_RE.sub('_', name)
+    name = REPEATED_UNDERSCORES_RE.sub('_', name)
     return name.strip('_').lower()
 
-def sanitize_column_name(name):
-    """Sanitizes a column name by replacing invalid characters."""
-    return name.replace('/', '_')
+# --- Scrape Output (Parquet) ---
+# One row per scraped student row; a page's dates are joined so they dictionary-encode to one value.
+# Each file records its subject name in the schema metadata, so an upload-only run can find it again.
+ATTENDANCE_SCHEMA = pa.schema([
+    ('section', pa.dictionary(pa.int32(), pa.string())),
+    ('dates', pa.dictionary(pa.int32(), pa.string())),
+    ('roll_no', pa.string()),
+    ('name', pa.string()),
+    ('status_codes', pa.string()),
+])
+
+def reset_scrape_staging():
+    """Creates an empty SCRAPE_STAGING_DIR for this run, leaving the previous run's output in place."""
+    shutil.rmtree(SCRAPE_STAGING_DIR, ignore_errors=True)
+    os.makedirs(SCRAPE_STAGING_DIR)
+
+def publish_scrape_output():
+    """Swaps the finished staging directory into SCRAPE_OUTPUT_DIR, replacing the previous run's files."""
+    shutil.rmtree(SCRAPE_OUTPUT_DIR, ignore_errors=True)
+    os.replace(SCRAPE_STAGING_DIR, SCRAPE_OUTPUT_DIR)
+
+def write_attendance_pages(writers: dict, subject_name: str, attendance_pages: list):
+    """Appends a course's scraped pages to the subject's staged Parquet file, opening it on first use."""
+    columns = {name: [] for name in ATTENDANCE_SCHEMA.names}
+    for page_data in attendance_pages:
+        dates = ','.join(page_data.dates)
+        for roll_no, name, status_codes in page_data.rows:
+            columns['section'].append(page_data.section)
+            columns['dates'].append(dates)
+            columns['roll_no'].append(roll_no)
+            columns['name'].append(name)
+            columns['status_codes'].append(status_codes)
+    if not columns['roll_no']:
+        return
+
+    # Writers are keyed by path: subjects that sanitize to the same name share one file, as they share one table.
+    table_name = sanitize_table_name(subject_name)
+    path = os.path.join(SCRAPE_STAGING_DIR, f"{table_name}.parquet")
+    file_subject, writer = writers.get(path, (subject_name, None))
+    if writer is None:
+        writer = pq.ParquetWriter(path, ATTENDANCE_SCHEMA.with_metadata({'subject': subject_name}))
+        writers[path] = (subject_name, writer)
+    elif file_subject != subject_name:
+        logging.warning(f"    -> '{subject_name}' and '{file_subject}' both map to table '{table_name}'; storing them together.")
+    writer.write_table(pa.Table.from_pydict(columns, schema=ATTENDANCE_SCHEMA))
+
+def find_scraped_subjects():
+    """Returns {subject_name: path} for the Parquet files already in SCRAPE_OUTPUT_DIR."""
+    subject_files = {}
+    for path in sorted(glob.glob(os.path.join(SCRAPE_OUTPUT_DIR, '*.parquet'))):
+        metadata = pq.read_schema(path).metadata or {}
+        subject_files[metadata.get(b'subject', b'').decode() or os.path.splitext(os.path.basename(path))[0]] = path
+    return subject_files
+
+def read_attendance_pages(path: str):
+    """Reads a subject's Parquet file back into attendance pages, one per run of equal section and dates."""
+    table = pq.read_table(path)
+    attendance_pages = []
+    current_key = None
+    for section, dates, roll_no, name, status_codes in zip(*(table.column(col).to_pylist() for col in ATTENDANCE_SCHEMA.names)):
+        if (section, dates) != current_key:
+            current_key = (section, dates)
+            page_data = AttendancePage(dates.split(',') if dates else [], [], section)
+            attendance_pages.append(page_data)
+        page_data.rows.append(StudentRow(roll_no, name, status_codes))
+    return attendance_pages
 
 # --- Supabase Interaction ---
-def recreate_table_for_upload(supabase: Client, table_name: str, df: pd.DataFrame):
-    """Drops and recreates a Supabase table with a new schema based on the DataFrame."""
-    logging.info(f"    -> Recreating table '{table_name}'...")
-    
-    drop_sql = f'DROP TABLE IF EXISTS public."{table_name}";'
-    supabase.rpc('execute_sql', {'sql': drop_sql}).execute()
-    logging.info(f"    -> Table '{table_name}' dropped.")
-    time.sleep(2)
-
-    columns_definitions = []
-    for col_name in df.columns:
-        if col_name == "Roll_No":
-            columns_definitions.append(f'"{col_name}" TEXT PRIMARY KEY')
-        else:
-            columns_definitions.append(f'"{col_name}" TEXT')
-            
-    create_sql = f'CREATE TABLE public."{table_name}" ({", ".join(columns_definitions)});'
-    
+def prepare_table_for_upload(supabase: Client, table_name: str, df: pd.DataFrame):
+    """Creates a subject's Supabase table on first use and adds any new columns to it."""
+    logging.info(f"    -> Preparing table '{table_name}'...")
+
+    column_names = ", ".join("'" + col.replace("'", "''") + "'" for col in df.columns if col != "Roll_No")
+
+    # Existing rows are kept for the upsert; the schema cache is only reloaded when DDL ran.
+    prepare_sql = f"""
+    DO $$
+    DECLARE
+        col TEXT;
+        schema_changed BOOLEAN := false;
+    BEGIN
+        IF to_regclass('public."{table_name}"') IS NULL THEN
+            CREATE TABLE public."{table_name}" ("Roll_No" TEXT PRIMARY KEY);
+            ALTER TABLE public."{table_name}" ENABLE ROW LEVEL SECURITY;
+            CREATE POLICY "Allow public access" ON public."{table_name}"
+            FOR ALL USING (true) WITH CHECK (true);
+            schema_changed := true;
+        END IF;
+
+        FOREACH col IN ARRAY ARRAY[{column_names}]::TEXT[] LOOP
+            IF NOT EXISTS (
+                SELECT 1 FROM information_schema.columns
+                WHERE table_schema = 'public' AND table_name = '{table_name}' AND column_name = col
+            ) THEN
+                EXECUTE format('ALTER TABLE public.%I ADD COLUMN %I TEXT', '{table_name}', col);
+                schema_changed := true;
+            END IF;
+        END LOOP;
+
+        IF schema_changed THEN
+            NOTIFY pgrst, 'reload schema';
+        END IF;
+    END $$;
+    """
+
     try:
-        supabase.rpc('execute_sql', {'sql': create_sql}).execute()
-        logging.info(f"    -> Table '{table_name}' created.")
-        
-        enable_rls_sql = f'ALTER TABLE public."{table_name}" ENABLE ROW LEVEL SECURITY;'
-        supabase.rpc('execute_sql', {'sql': enable_rls_sql}).execute()
-
-        create_policy_sql = f"""
-        DROP POLICY IF EXISTS "Allow public access" ON public."{table_name}";
-        CREATE POLICY "Allow public access" ON public."{table_name}"
-        FOR ALL USING (true) WITH CHECK (true);
-        """
-        supabase.rpc('execute_sql', {'sql': create_policy_sql}).execute()
-        logging.info(f"    -> RLS and policy applied to '{table_name}'.")
-        time.sleep(5)
+        supabase.rpc('execute_sql', {'sql': prepare_sql}).execute()
+        logging.info(f"    -> Table '{table_name}' is ready.")
     except Exception as e:
-        logging.error(f"    -> ❌ FAILED to create table or apply policy. Error: {e}")
+        logging.error(f"    -> ❌ FAILED to prepare table '{table_name}'. Error: {e}")
         raise
 
-def upload_to_supabase(supabase: Client, subject_name: str, student_records: list):
-    """Processes scraped data and uploads it to a Supabase table."""
-    if not student_records:
+def fetch_existing_rows(supabase: Client, table_name: str, columns: list):
+    """Returns the given columns of the rows already stored in a subject's table, keyed by Roll_No."""
+    # Every uploaded column is needed to tell whether a row changed; older date columns are not.
+    select_columns = ",".join(f'"{col}"' for col in columns)
+    existing_rows = {}
+    start = 0
+    while True:
+        response = supabase.table(table_name).select(select_columns).order('Roll_No').range(start, start + FETCH_PAGE_SIZE - 1).execute()
+        for row in response.data:
+            existing_rows[row['Roll_No']] = row
+        if len(response.data) < FETCH_PAGE_SIZE:
+            return existing_rows
+        start += FETCH_PAGE_SIZE
+
+def post_upsert(supabase: Client, table_name: str, records: list):
+    """Upserts records on Roll_No through the PostgREST session with an orjson-encoded body."""
+    response = supabase.postgrest.session.post(
+        f"/{table_name}",
+        params={'on_conflict': 'Roll_No'},
+        content=orjson.dumps(records),
+        headers={'Content-Type': 'application/json', 'Prefer': 'resolution=merge-duplicates,return=minimal'},
+    )
+    response.raise_for_status()
+
+def call_with_retry(action: str, func, *args):
+    """Calls a Supabase request function, retrying with exponential backoff on failure."""
+    for attempt in range(1, SUPABASE_MAX_RETRIES + 1):
+        try:
+            return func(*args)
+        except Exception as e:
+            if attempt == SUPABASE_MAX_RETRIES:
+                raise
+            delay = 2 ** attempt
+            logging.warning(f"    -> {action} attempt {attempt} failed ({e}). Retrying in {delay}s...")
+            time.sleep(delay)
+
+def iter_records(df: pd.DataFrame):
+    """Yields each DataFrame row as a dict, with missing values as None."""
+    columns = df.columns.tolist()
+    # Missing values are replaced per column in one vectorized step rather than tested per cell,
+    # so each column is materialized as a list once and rows are assembled from those lists.
+    values_by_column = [df[col].astype(object).where(df[col].notna(), None).tolist() for col in columns]
+    for values in zip(*values_by_column):
+        yield dict(zip(columns, values))
+
+def upload_to_supabase(supabase: Client, subject_name: str, attendance_pages: list):
+    """Processes scraped attendance pages and uploads them to a Supabase table."""
+    if not any(page_data.rows for page_data in attendance_pages):
         logging.warning(f"No records found for '{subject_name}', skipping upload.")
         return
 
     table_name = sanitize_table_name(subject_name)
     logging.info(f"\n======= UPLOADING TO SUPABASE TABLE: {table_name} =======")
 
-    long_format_data = []
-    for record in student_records:
-        for date, status in record['attendance_data'].items():
-            long_format_data.append({
-                'Roll_No': record['roll_no'], 'Name': record['student_name'],
-                'Section': record.get('section', 'Unknown'), 'Date': date, 'Status': status
-            })
-    
-    if not long_format_data:
+    # Merge every page into one {date: status_code} dict per student in a single pass (first status wins).
+    students = {}
+    all_dates = {}
+    for page_data in attendance_pages:
+        dates = page_data.dates
+        all_dates.update(dict.fromkeys(dates))
+        for roll_no, name, status_codes in page_data.rows:
+            student = students.get(roll_no)
+            if student is None:
+                student = students[roll_no] = (name, page_data.section, {})
+            attendance = student[2]
+            for date, code in zip(dates, status_codes):
+                if code != MISSING_STATUS_CODE and date not in attendance:
+                    attendance[date] = code
+
+    if not all_dates:
         logging.warning(f"    -> No attendance dates were processed for '{subject_name}'.")
         return
 
-    df_long = pd.DataFrame(long_format_data)
-    df_pivot = df_long.pivot_table(
-        index=['Roll_No', 'Name', 'Section'], columns='Date', values='Status', aggfunc='first'
-    )
-    
-    date_cols = df_pivot.columns.tolist()
-    sorted_date_cols = sorted(date_cols, key=lambda d: pd.to_datetime(d, format='%d/%m/%Y'))
-    df_pivot = df_pivot[sorted_date_cols]
-    df_pivot.columns = [sanitize_column_name(col) for col in df_pivot.columns]
-    df_final = df_pivot.reset_index()
+    # Order the DD/MM/YYYY labels with a single vectorized parse.
+    date_cols = list(all_dates)
+    parsed_dates = pd.to_datetime(pd.Index(date_cols), format='%d/%m/%Y')
+    sorted_date_cols = [date_cols[i] for i in parsed_dates.argsort()]
+
+    # Section and the per-date statuses hold only a handful of distinct values, so they are
+    # built as categoricals up front; status codes map straight to category positions.
+    df_final = pd.DataFrame({
+        'Roll_No': list(students),
+        'Name': [name for name, _, _ in students.values()],
+        'Section': pd.Categorical([section for _, section, _ in students.values()]),
+        **{
+            date: pd.Categorical.from_codes(
+                [STATUS_CODES.find(attendance.get(date, MISSING_STATUS_CODE)) for _, _, attendance in students.values()],
+                categories=STATUS_CATEGORIES
+            )
+            for date in sorted_date_cols
+        }
+    })
+    df_final.columns = df_final.columns.str.replace('/', '_', regex=False)
     logging.info(f"    -> Processed data into a table with {df_final.shape[0]} rows and {df_final.shape[1]} columns.")
 
-    recreate_table_for_upload(supabase, table_name, df_final)
-    records_to_upload = df_final.where(pd.notna(df_final), None).to_dict(orient='records')
+    prepare_table_for_upload(supabase, table_name, df_final)
 
-    logging.info(f"    -> Attempting to insert {len(records_to_upload)} records into '{table_name}'...")
-    try:
-        supabase.table(table_name).insert(records_to_upload).execute()
-        logging.info(f"    -> ✅ Successfully inserted data for '{subject_name}'.")
-    except Exception as e:
-        logging.error(f"    -> ❌ FAILED to insert data for '{subject_name}'. Error: {e}")
+    # Only send students whose row is new or differs from what is already stored. A table created
+    # just now may not be in PostgREST's schema cache yet, so the read is retried until it is.
+    existing_rows = call_with_retry("Fetch", fetch_existing_rows, supabase, table_name, df_final.columns.tolist())
+    # Collected rather than streamed: only changed rows are kept, and chunking and progress need the total.
+    records_to_upload = [
+        record for record in iter_records(df_final)
+        if any(existing_rows.get(record['Roll_No'], {}).get(col) != value for col, value in record.items())
+    ]
+    total = len(records_to_upload)
+    if not total:
+        logging.info(f"    -> ✅ '{table_name}' is already up to date.")
+        return
+    logging.info(f"    -> {total} of {len(df_final)} rows are new or changed.")
+
+    chunks = (records_to_upload[start:start + UPSERT_CHUNK_SIZE] for start in range(0, total, UPSERT_CHUNK_SIZE))
+    logging.info(f"    -> Attempting to upsert {total} records into '{table_name}'...")
+
+    upserted, failed = 0, False
+    with ThreadPoolExecutor(max_workers=UPSERT_WORKERS) as executor:
+        futures = {executor.submit(call_with_retry, "Upsert", post_upsert, supabase, table_name, chunk): len(chunk) for chunk in chunks}
+        for future in as_completed(futures):
+            try:
+                future.result()
+                upserted += futures[future]
+                logging.info(f"    -> Upserted {upserted} of {total} records into '{table_name}'.")
+            except Exception as e:
+                logging.error(f"    -> ❌ FAILED to upsert a chunk for '{subject_name}'. Error: {e}")
+                failed = True
+
+    if not failed:
+        logging.info(f"    -> ✅ Successfully upserted data for '{subject_name}'.")
+
+def upload_subject_file(supabase: Client, subject_name: str, path: str):
+    """Loads one subject's scraped pages from Parquet and uploads them."""
+    upload_to_supabase(supabase, subject_name, read_attendance_pages(path))
+
+def upload_all_to_supabase(supabase: Client, subject_files: dict):
+    """Uploads every subject's Parquet file concurrently, bounded by UPLOAD_WORKERS."""
+    with ThreadPoolExecutor(max_workers=UPLOAD_WORKERS) as executor:
+        futures = {
+            executor.submit(upload_subject_file, supabase, subject, path): subject
+            for subject, path in subject_files.items()
+        }
+        for future in as_completed(futures):
+            try:
+                future.result()
+            except Exception as e:
+                logging.error(f"❌ Upload failed for '{futures[future]}'. Error: {e}")
 
 # --- Scraping Logic ---
-def get_data_for_course(page):
-    """Scrapes all attendance pages for a selected course by navigating backwards."""
-    all_student_records = []
+async def human_pause(min_seconds, max_seconds):
+    """Sleeps for a random human-like interval, only when SIMULATE_HUMAN is enabled."""
+    if SIMULATE_HUMAN:
+        await asyncio.sleep(random.uniform(min_seconds, max_seconds))
+
+# Installed once per browser context, so each call only ships a short expression.
+PAGE_HELPERS_JS = """
+window.__tableSignature = () =>
+    (document.querySelector('thead')?.innerText ?? '') + '|' +
+    (document.querySelector('tbody tr:first-child')?.innerText ?? '');
+window.__tableHtml = () => document.querySelector('table')?.outerHTML ?? '';
+"""
+
+async def click_and_wait_for_table(page, button):
+    """Clicks a pagination button and waits until the table shows different content."""
+    previous_signature = await page.evaluate("window.__tableSignature()")
+    await button.click()
+    await page.wait_for_function(
+        "previous => window.__tableSignature() !== previous", arg=previous_signature, timeout=15000
+    )
+
+HEADER_CELLS_XPATH = etree.XPath('.//thead//th')
+BODY_ROWS_XPATH = etree.XPath('.//tbody/tr')
+ROW_CELLS_XPATH = etree.XPath('./td')
+
+def cell_status_code(cell):
+    """Maps a rendered attendance cell to its one-character code in STATUS_CODES."""
+    # A cell holds at most one status icon, so only the first svg needs checking.
+    icon = next(cell.iter('svg'), None)
+    if icon is not None:
+        icon_classes = icon.get('class', '').split()
+        if 'lucide-check' in icon_classes:
+            return 'P'
+        if 'lucide-x' in icon_classes:
+            return 'A'
+    return 'N' if cell.text_content().strip() == 'NA' else 'U'
+
+def parse_attendance_table(table_html):
+    """Parses the attendance table HTML into an AttendancePage with one lxml pass.
+
+    Each row is a StudentRow whose status_codes packs one STATUS_CODES character per
+    entry in dates ('-' when the row has no such cell).
+    """
+    if not table_html:
+        return AttendancePage([], [])
+    table = lxml_html.fromstring(table_html)
+
+    dates, date_indexes = [], []
+    for index, th in enumerate(HEADER_CELLS_XPATH(table)):
+        header_text = th.text_content().strip()
+        if DATE_HEADER_RE.match(header_text):
+            dates.append(header_text)
+            date_indexes.append(index)
+
+    rows = []
+    for row in BODY_ROWS_XPATH(table):
+        cells = ROW_CELLS_XPATH(row)
+        if len(cells) < 2:
+            continue
+        status_codes = ''.join(
+            cell_status_code(cells[column_index]) if column_index < len(cells) else MISSING_STATUS_CODE
+            for column_index in date_indexes
+        )
+        rows.append(StudentRow(cells[0].text_content().strip(), cells[1].text_content().strip(), status_codes))
+    return AttendancePage(dates, rows)
+
+async def evaluate_value(cdp, expression):
+    """Evaluates a JS expression over CDP and returns its primitive result as is."""
+    response = await cdp.send('Runtime.evaluate', {
+        'expression': expression,
+        'returnByValue': True,
+        'awaitPromise': False,
+    })
+    if 'exceptionDetails' in response:
+        raise RuntimeError(f"Page script failed: {response['exceptionDetails'].get('text')}")
+    return response['result'].get('value')
+
+async def get_data_for_course(page):
+    """Scrapes all attendance pages for a selected course, walking forwards page by page."""
+    attendance_pages = []
+    total_rows = 0
     logging.info("      -> Starting to scrape data for the selected course.")
+    cdp = await page.context.new_cdp_session(page)
+    # Locators are lazy, so one binding serves every page turn.
+    next_button = page.get_by_role("button", name="Next")
 
-    # --- Navigate to the last page ---
-    logging.info("      -> Trying to find the 'Next' button to go to the last page.")
-    page_count = 1
-    while True:
-        try:
-            page.wait_for_selector('button:has-text("Next")', state="attached", timeout=10000)
-            next_button = page.get_by_role("button", name="Next")
-            if not next_button.is_enabled():
-                logging.info(f"      -> 'Next' button is disabled. Reached the last page (Page {page_count}).")
-                break
-            next_button.click()
-            page.wait_for_load_state('networkidle', timeout=30000)
-            page_count += 1
-        except Exception:
-            logging.info("      -> 'Next' button not found or timed out. Assuming this is the last page.")
-            break
-
-    # --- Scrape backwards from the last page ---
-    page_num = 0
-    while True:
-        page_num += 1
-        logging.info(f"      -> Scraping page set {page_num} (from end to start)...")
+    try:
+        # Later pages are awaited by click_and_wait_for_table, so only the first needs this.
         try:
-            page.wait_for_selector("table > tbody > tr:first-child", timeout=20000)
+            await page.wait_for_selector("table > tbody > tr:first-child", timeout=20000)
         except PlaywrightTimeoutError:
             logging.warning("      -> WARNING - Timed out waiting for table content. The page might be empty.")
-            pass
-
-        page_data = page.evaluate("""() => {
-            const records = [];
-            const headerCells = Array.from(document.querySelectorAll('thead th'));
-            const dateHeaderMap = {};
-            headerCells.forEach((th, index) => {
-                const headerText = th.innerText.trim();
-                if (/^\\d{2}\\/\\d{2}\\/\\d{4}$/.test(headerText)) { dateHeaderMap[headerText] = index; }
-            });
-            const studentRows = document.querySelectorAll('tbody tr');
-            studentRows.forEach(row => {
-                const cells = row.querySelectorAll('td');
-                if (cells.length < 2) return;
-                const record = {
-                    'roll_no': cells[0].innerText.trim(),
-                    'student_name': cells[1].innerText.trim(),
-                    'attendance_data': {}
-                };
-                for (const [date, columnIndex] of Object.entries(dateHeaderMap)) {
-                    const cell = cells[columnIndex];
-                    if (cell) {
-                        let status = 'Unknown';
-                        if (cell.querySelector('svg.lucide-check')) status = 'P';
-                        else if (cell.querySelector('svg.lucide-x')) status = 'A';
-                        else if (cell.innerText.trim() === 'NA') status = 'NA';
-                        record.attendance_data[date] = status;
-                    }
-                }
-                records.push(record);
-            });
-            return records;
-        }""")
-        
-        all_student_records.extend(page_data)
 
-        try:
-            page.wait_for_selector('button:has-text("Previous")', state="attached", timeout=10000)
-            prev_button = page.get_by_role("button", name="Previous")
-            if not prev_button.is_enabled():
-                logging.info("      -> 'Previous' button is disabled. Reached the first page.")
+        page_num = 0
+        while True:
+            page_num += 1
+            if page_num > MAX_PAGES_PER_COURSE:
+                logging.error(f"      -> Aborting: pagination exceeded {MAX_PAGES_PER_COURSE} pages.")
                 break
-            prev_button.click()
-            page.wait_for_load_state('networkidle', timeout=30000)
-        except Exception:
-            logging.info("      -> 'Previous' button not found or timed out. Stopping scrape for this course.")
-            break
-            
-    logging.info(f"      -> Finished scraping for this course. Total records found: {len(all_student_records)}")
-    return all_student_records
+            logging.info(f"      -> Scraping page set {page_num}...")
 
-def run_scraper():
-    """Main function to orchestrate the browser automation and scraping process."""
-    all_subjects_data = {}
-    # Use the standard playwright context manager
-    with sync_playwright() as p:
-        logging.info(">>> Launching stealth browser...")
-        browser = p.chromium.launch(headless=HEADLESS_MODE)
-        page = browser.new_page()
-        
-        # Apply stealth settings to the page
-        stealth_sync(page)
-        
-        page.set_default_timeout(90000) 
-        
-        try:
-            logging.info(f">>> Navigating to {ATTENDANCE_URL}")
-            page.goto(ATTENDANCE_URL, wait_until="domcontentloaded", timeout=120000)
-            
-            logging.info(">>> Page loaded. Waiting for dynamic content...")
-            time.sleep(random.uniform(5, 8))
-
-            # --- Apply Filters ---
-            logging.info(">>> Applying filters...")
-            page.locator('label:has-text("Select Department") + button').click()
-            time.sleep(random.uniform(1, 2.5))
-            page.get_by_role("option", name="Computer Science and Engineering", exact=True).click()
-            time.sleep(random.uniform(2, 3.5))
-
-            page.locator('label:has-text("Select Batch") + button').click()
-            time.sleep(random.uniform(1, 2.5))
-            page.get_by_role("option", name="2024-2028", exact=True).click()
-            time.sleep(random.uniform(2, 3.5))
-
-            page.locator('label:has-text("Select Semester") + button').click()
-            time.sleep(random.uniform(1, 2.5))
-            page.get_by_role("option", name="Semester 3", exact=True).click()
-            
-            section_dropdown_selector = 'label:has-text("Select Section") + button'
-            page.wait_for_selector(section_dropdown_selector, state="visible", timeout=30000)
-            logging.info(">>> Filters applied. Ready to loop through sections.\n")
-
-            # --- Loop Through Sections, Types, and Courses ---
-            sections = ["Section Section A", "Section Section B", "Section Section C"]
-            for section_name in sections:
-                logging.info(f"======= PROCESSING SECTION: {section_name.replace('Section Section ', '')} =======")
-                page.locator(section_dropdown_selector).click()
-                time.sleep(random.uniform(1, 2.5))
-                page.get_by_role("option", name=section_name, exact=True).click()
-                page.wait_for_load_state('networkidle')
-                time.sleep(random.uniform(2, 4))
-
-                for attendance_type in ["RTU Classes", "Labs"]:
-                    logging.info(f"  --- Processing Type: {attendance_type} ---")
-                    page.locator('label:has-text("Select Attendance Type") + button').click()
-                    time.sleep(random.uniform(1, 2.5))
-                    page.get_by_role("option", name=attendance_type, exact=True).click()
-                    page.wait_for_load_state('networkidle')
-                    time.sleep(random.uniform(2, 4))
-
-                    course_dropdown = page.locator('label:has-text("Select Course") + button')
-                    course_dropdown.click()
-                    listbox_locator = 'div[role="listbox"]'
-                    page.wait_for_selector(listbox_locator, state="visible", timeout=15000)
-                    course_list_locators = page.locator(f'{listbox_locator} [role="option"]:not(:has-text("Overall Attendance"))').all()
-                    course_list_names = [item.inner_text() for item in course_list_locators]
-                    page.keyboard.press("Escape")
-                    
-                    for course_name_with_code in course_list_names:
-                        subject_name = course_name_with_code.split(' (')[0].strip()
-                        logging.info(f"    -> Scraping Course: {course_name_with_code}")
-                        course_dropdown.click()
-                        time.sleep(random.uniform(1, 2))
-                        page.get_by_role("option", name=course_name_with_code, exact=True).click()
-                        
-                        course_data = get_data_for_course(page)
-                        
-                        clean_section_name = section_name.replace('Section Section', 'Section')
-                        for record in course_data:
-                            record['section'] = clean_section_name
-                            
-                        if subject_name not in all_subjects_data:
-                            all_subjects_data[subject_name] = []
-                        all_subjects_data[subject_name].extend(course_data)
+            page_data = parse_attendance_table(await evaluate_value(cdp, "window.__tableHtml()"))
+
+            attendance_pages.append(page_data)
+            total_rows += len(page_data.rows)
+
+            try:
+                if not await next_button.is_enabled(timeout=10000):
+                    logging.info(f"      -> 'Next' button is disabled. Reached the last page (Page {page_num}).")
+                    break
+                await click_and_wait_for_table(page, next_button)
+            except PlaywrightTimeoutError:
+                logging.info("      -> 'Next' button not found or timed out. Stopping scrape for this course.")
+                break
+    finally:
+        await cdp.detach()
+    logging.info(f"      -> Finished scraping for this course. Total records found: {total_rows}")
+    return attendance_pages
+
+async def open_dropdown(page, dropdown_selector):
+    """Clicks a dropdown and waits until its options are rendered."""
+    await page.locator(dropdown_selector).click()
+    await page.wait_for_selector(LISTBOX_OPTION_SELECTOR, state="visible", timeout=DROPDOWN_TIMEOUT)
+    await human_pause(1, 2.5)
+
+async def wait_for_new_options(page, previous_options):
+    """Waits until the open listbox lists different options than previous_options."""
+    try:
+        await page.wait_for_function(
+            """([selector, previous]) => {
+                const options = Array.from(document.querySelectorAll(selector), option => option.innerText);
+                return options.length > 0 && options.join('\\n') !== previous;
+            }""",
+            arg=[LISTBOX_OPTION_SELECTOR, '\n'.join(previous_options)], timeout=DROPDOWN_TIMEOUT
+        )
+    except PlaywrightTimeoutError:
+        logging.warning(">>> Course options did not change after switching type; using them as listed.")
+
+async def select_filter(page, label, option_name):
+    """Picks an option from a labelled dropdown unless a restored session already selected it."""
+    dropdown_selector = f'label:has-text("{label}") + button'
+    if (await page.locator(dropdown_selector).inner_text()).strip() == option_name:
+        logging.info(f">>> '{option_name}' already selected for '{label}', skipping.")
+        return
+    await open_dropdown(page, dropdown_selector)
+    await page.get_by_role("option", name=option_name, exact=True).click()
+
+async def apply_filters(page):
+    """Selects the department, batch and semester filters shared by every section."""
+    logging.info(">>> Applying filters...")
+    await select_filter(page, "Select Department", "Computer Science and Engineering")
+    await expect(page.locator('label:has-text("Select Batch") + button')).to_be_enabled()
+    await human_pause(2, 3.5)
+
+    await select_filter(page, "Select Batch", "2024-2028")
+    await expect(page.locator('label:has-text("Select Semester") + button')).to_be_enabled()
+    await human_pause(2, 3.5)
+
+    await select_filter(page, "Select Semester", "Semester 3")
+
+    await page.wait_for_selector(SECTION_DROPDOWN_SELECTOR, state="visible", timeout=30000)
+
+async def new_stealth_page(context):
+    """Opens a new page in the given browser context with stealth settings applied."""
+    page = await context.new_page()
+    await stealth_async(page)
+    page.set_default_timeout(90000)
+    return page
+
+async def load_section(page, section_name):
+    """Navigates to the attendance page and applies all filters down to the section."""
+    section_label = section_name.replace('Section Section ', '')
+    logging.info(f">>> [Section {section_label}] Navigating to {ATTENDANCE_URL}")
+    await page.goto(ATTENDANCE_URL, wait_until="domcontentloaded", timeout=120000)
+
+    logging.info(f">>> [Section {section_label}] Page loaded. Waiting for dynamic content...")
+    await page.locator('label:has-text("Select Department") + button').wait_for(state="visible")
+
+    await apply_filters(page)
+
+    await open_dropdown(page, SECTION_DROPDOWN_SELECTOR)
+    await page.get_by_role("option", name=section_name, exact=True).click()
+    await page.locator(ATTENDANCE_TYPE_DROPDOWN_SELECTOR).wait_for(state="visible")
+    await human_pause(2, 4)
+
+async def select_attendance_type(page, attendance_type):
+    """Selects the attendance type (RTU Classes or Labs) on a section page."""
+    await open_dropdown(page, ATTENDANCE_TYPE_DROPDOWN_SELECTOR)
+    await page.get_by_role("option", name=attendance_type, exact=True).click()
+    await expect(page.locator(COURSE_DROPDOWN_SELECTOR)).to_be_enabled()
+    await human_pause(2, 4)
 
+async def scrape_course(context, writers, section_name, attendance_type, course_name_with_code):
+    """Scrapes one course on its own page and appends it to its subject's Parquet file."""
+    section_label = section_name.replace('Section Section ', '')
+    page = await new_stealth_page(context)
+    try:
+        await load_section(page, section_name)
+        await select_attendance_type(page, attendance_type)
+
+        logging.info(f"    -> [Section {section_label}] Scraping Course: {course_name_with_code}")
+        await open_dropdown(page, COURSE_DROPDOWN_SELECTOR)
+        await page.get_by_role("option", name=course_name_with_code, exact=True).click()
+
+        course_data = await get_data_for_course(page)
+
+        clean_section_name = section_name.replace('Section Section', 'Section')
+        course_data = [page_data._replace(section=clean_section_name) for page_data in course_data]
+        subject_name = course_name_with_code.split(' (')[0].strip()
+        write_attendance_pages(writers, subject_name, course_data)
+    except Exception as e:
+        screenshot_path = f"scraper_error_{section_label.lower()}_{sanitize_table_name(course_name_with_code)}.png"
+        logging.error(f"\n>>> ❌ AN ERROR OCCURRED in Section {section_label}, course '{course_name_with_code}': {e}")
+        logging.info(f">>> Taking a screenshot of the page: {screenshot_path}")
+        await page.screenshot(path=screenshot_path)
+    finally:
+        await page.close()
+
+async def new_section_context(browser):
+    """Opens a browser context, restoring the saved session when it is present and readable."""
+    if os.path.exists(STORAGE_STATE_PATH):
+        try:
+            return await browser.new_context(storage_state=STORAGE_STATE_PATH)
         except Exception as e:
-            logging.error(f"\n>>> ❌ AN ERROR OCCURRED: {e}")
-            logging.info(">>> Taking a screenshot of the page: scraper_error.png")
-            page.screenshot(path="scraper_error.png")
-        finally:
-            logging.info("\n>>> Closing browser.")
-            browser.close()
-    return all_subjects_data
+            logging.warning(f">>> Could not restore session from '{STORAGE_STATE_PATH}' ({e}). Starting fresh.")
+    return await browser.new_context()
+
+async def save_storage_state(context, section_label):
+    """Saves the context's session via a per-section temp file so concurrent sections never interleave writes."""
+    temp_path = f"{STORAGE_STATE_PATH}.{section_label.lower()}.tmp"
+    await context.storage_state(path=temp_path)
+    os.replace(temp_path, STORAGE_STATE_PATH)
+
+async def scrape_section(browser, writers, section_name):
+    """Scrapes every course of one section in a fresh browser context."""
+    section_label = section_name.replace('Section Section ', '')
+    context = await new_section_context(browser)
+    await context.add_init_script(PAGE_HELPERS_JS)
+    page = await new_stealth_page(context)
+    semaphore = asyncio.Semaphore(MAX_PARALLEL_COURSES)
+
+    async def bounded_scrape_course(attendance_type, course_name_with_code):
+        async with semaphore:
+            return await scrape_course(context, writers, section_name, attendance_type, course_name_with_code)
+
+    try:
+        # --- Loop Through Types and Courses ---
+        logging.info(f"======= PROCESSING SECTION: {section_label} =======")
+        await load_section(page, section_name)
+        await save_storage_state(context, section_label)
+
+        previous_options = None
+        for attendance_type in ["RTU Classes", "Labs"]:
+            logging.info(f"  --- [Section {section_label}] Processing Type: {attendance_type} ---")
+            await select_attendance_type(page, attendance_type)
+
+            await open_dropdown(page, COURSE_DROPDOWN_SELECTOR)
+            # The course dropdown stays enabled between types, so wait for the previous type's list to be replaced.
+            if previous_options is not None:
+                await wait_for_new_options(page, previous_options)
+            previous_options = await page.locator(LISTBOX_OPTION_SELECTOR).all_inner_texts()
+            course_list_names = [name for name in previous_options if 'Overall Attendance' not in name]
+            await page.keyboard.press("Escape")
+
+            await asyncio.gather(
+                *[bounded_scrape_course(attendance_type, course) for course in course_list_names]
+            )
+
+    except Exception as e:
+        screenshot_path = f"scraper_error_{section_label.lower()}.png"
+        logging.error(f"\n>>> ❌ AN ERROR OCCURRED in Section {section_label}: {e}")
+        logging.info(f">>> Taking a screenshot of the page: {screenshot_path}")
+        await page.screenshot(path=screenshot_path)
+    finally:
+        await context.close()
+
+async def run_scraper_async():
+    """Scrapes all sections concurrently and returns the Parquet file written for each subject."""
+    reset_scrape_staging()
+    writers = {}
+    try:
+        async with async_playwright() as p:
+            logging.info(">>> Launching stealth browser...")
+            browser = await p.chromium.launch(headless=HEADLESS_MODE)
+            try:
+                await asyncio.gather(*[scrape_section(browser, writers, s) for s in SECTIONS])
+            finally:
+                logging.info("\n>>> Closing browser.")
+                await browser.close()
+    finally:
+        for _, writer in writers.values():
+            writer.close()
+
+    # The previous run's files are only replaced once this scrape has finished with data.
+    if not writers:
+        return {}
+    publish_scrape_output()
+    return find_scraped_subjects()
+
+def run_scraper():
+    """Main function to orchestrate the browser automation and scraping process."""
+    return asyncio.run(run_scraper_async())
 
 if __name__ == "__main__":
     if not SUPABASE_URL or not SUPABASE_KEY:
@@ -299,13 +650,16 @@ if __name__ == "__main__":
     else:
         try:
             supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
-            logging.info("--- Starting Scraper ---")
             start_time = time.time()
-            all_data = run_scraper()
-            if all_data:
-                logging.info("\n--- Scraper finished. Starting Supabase upload process. ---")
-                for subject, records in all_data.items():
-                    upload_to_supabase(supabase, subject, records)
+            if UPLOAD_ONLY:
+                logging.info(f"--- Upload only: skipping the scraper and reusing '{SCRAPE_OUTPUT_DIR}' ---")
+                subject_files = find_scraped_subjects()
+            else:
+                logging.info("--- Starting Scraper ---")
+                subject_files = run_scraper()
+            if subject_files:
+                logging.info(f"\n--- Uploading {len(subject_files)} subjects from '{SCRAPE_OUTPUT_DIR}'. ---")
+                upload_all_to_supabase(supabase, subject_files)
             else:
                 logging.warning("\n--- WARNING: No data was scraped. Nothing to upload. ---")
             end_time = time.time()